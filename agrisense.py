@@ -4,167 +4,593 @@ Requires: experta  (pip install experta)
 
 This is a self-contained example engine with:
 - Facts for Crop, Soil, Symptoms, Weather, Lab (NPK, pH), PestPresence
+  (plus LabLevels, the NPK interpretation shared by the fertilizer rules)
 - Rules for diagnosing common issues and recommending fertilizers/treatments
 - Example facts and demo run()
 
 Note: This system is advisory and simplified. Use local agronomist/lab results for final decisions.
 """
 
+import heapq
+import inspect
+from functools import lru_cache, partial
+from itertools import count
+from operator import gt, lt
+
 from experta import *
+from experta.agenda import Agenda
+from experta.conditionalelement import ConditionalElement
+from experta.strategies import DepthStrategy
 
 # -------------------------
 # Fact definitions
 # -------------------------
+# Experta facts are dicts, so they cannot use __slots__; each class instead
+# lists its documented slots in _PUBLIC_FIELDS, which is what gets rendered.
 class Crop(Fact):
     """Crop(name='tomato', stage='vegetative'|'flowering'|'fruiting')"""
-    pass
+    _PUBLIC_FIELDS = ('name', 'stage')
 
 class Soil(Fact):
     """Soil(type='clay'|'sandy'|'loam', moisture='low'|'adequate'|'high', ph=float)"""
-    pass
+    _PUBLIC_FIELDS = ('type', 'moisture', 'ph')
 
 class Lab(Fact):
     """Lab(N=ppm, P=ppm, K=ppm, ph=float). Units simplified."""
-    pass
+    _PUBLIC_FIELDS = ('N', 'P', 'K', 'ph')
 
 class Symptoms(Fact):
     """Symptoms(leaf_spots=True, yellowing=True, wilting=True, stem_lesions=True,
                 mosaic=True, powdery_white=True, black_sooty=True)"""
-    pass
+    _PUBLIC_FIELDS = ('leaf_spots', 'yellowing', 'wilting', 'stem_lesions',
+                      'mosaic', 'powdery_white', 'black_sooty')
 
 class Weather(Fact):
     """Weather(temp=float (C), humidity=int (pct), recent_rain_days=int)"""
-    pass
+    _PUBLIC_FIELDS = ('temp', 'humidity', 'recent_rain_days')
 
 class PestPresence(Fact):
     """PestPresence(aphids=True, mites=True, caterpillars=True, whiteflies=True)"""
-    pass
+    _PUBLIC_FIELDS = ('aphids', 'mites', 'caterpillars', 'whiteflies')
+
+class LabLevels(Fact):
+    """LabLevels(Nlvl, Plvl, Klvl) - qualitative NPK levels derived once from Lab"""
+    _PUBLIC_FIELDS = ('Nlvl', 'Plvl', 'Klvl')
 
 class Diagnosis(Fact):
     """Holds a diagnosis result"""
-    pass
+    _PUBLIC_FIELDS = ('disease', 'confidence', 'notes')
 
 class Recommendation(Fact):
     """Holds a fertilizer/treatment recommendation"""
-    pass
+    _PUBLIC_FIELDS = ('treatment', 'fertilizer_recommendations', 'stage_advice',
+                      'soil_ph_note', 'general')
+
+# Values offered for the categorical slots above
+CROPS = ('tomato', 'wheat', 'maize', 'rice')
+STAGES = ('vegetative', 'flowering', 'fruiting')
+SOIL_TYPES = ('loam', 'clay', 'sandy')
+MOISTURE_LEVELS = ('low', 'adequate', 'high')
+
+# -------------------------
+# Thresholds
+# -------------------------
+# thresholds are illustrative — adapt to real lab ranges & crop needs
+NPK_LOW = 50            # ppm below which N/P/K is 'low'
+NPK_HIGH = 150          # ppm from which N/P/K is 'high'
+HUMIDITY_BLIGHT = 75    # pct above which spots + lesions point to blight
+PH_ACIDIC = 5.5         # soil pH below this needs liming
+PH_ALKALINE = 7.8       # soil pH above this needs acidifying
+
+# Rule predicates as C-level comparisons, so matching a candidate fact does
+# not set up a Python frame per test; partial(lt, x)(v) is x < v.
+ABOVE_BLIGHT_HUMIDITY = partial(lt, HUMIDITY_BLIGHT)
+BELOW_NPK_LOW = partial(gt, NPK_LOW)
+
+# Crops whose soil pH range differs from the PH_ACIDIC..PH_ALKALINE default
+CROP_PH_RANGE = {
+    'rice': (5.0, 7.0),    # paddy rice tolerates acidic, flooded soils
+}
+# Rules that do not apply to a crop and are left out of its engine
+CROP_EXCLUDED_RULES = {
+    'wheat': {'insect_damage_wilt'},    # larval wilt is rare in wheat
+}
+
+# -------------------------
+# Rule outputs
+# -------------------------
+# Slot values of the conclusions the rules draw, shared with agrisense_fast.
+# Rules declare fresh facts from them (Diagnosis(**POWDERY_DIAG)): declaring
+# stamps a __factid__ on the fact, so a single Fact instance cannot be reused
+# across runs or engines.
+POWDERY_DIAG = dict(disease='Powdery Mildew',
+                    confidence=0.8,
+                    notes='Look for white powder on leaf surfaces')
+POWDERY_REC = dict(treatment='Apply fungicide targeting powdery mildew; improve air circulation; remove heavily infected leaves')
+
+BLIGHT_DIAG = dict(disease='Blight-like infection (possible bacterial/fungal)',
+                   confidence=0.85,
+                   notes='Leaf spots + stem lesions; wet humid weather favors blights')
+BLIGHT_REC = dict(treatment='Use appropriate bactericide/fungicide; remove infected material; avoid overhead irrigation')
+
+MOSAIC_DIAG = dict(disease='Viral Mosaic',
+                   confidence=0.9,
+                   notes='Mosaic patterns on leaves often indicate virus; vector control important')
+MOSAIC_REC = dict(treatment='No chemical cure for virus; rogue and destroy infected plants; control aphids/whiteflies')
+
+INSECT_DIAG = dict(disease='Insect damage (larval feeding)',
+                   confidence=0.75,
+                   notes='Wilting with caterpillars suggests stem/root boring or heavy defoliation')
+INSECT_REC = dict(treatment='Inspect for larvae; use biological control (Bt) or targeted insecticide; remove affected parts')
+
+NITROGEN_DIAG = dict(disease='Nutrient deficiency - Nitrogen',
+                     confidence=0.8,
+                     notes='Yellowing, especially older leaves, suggests N deficiency')
+NITROGEN_REC = dict(treatment='Top-dress with nitrogenous fertilizer (e.g., urea) as per crop need; split applications')
+
+VECTOR_DIAG = dict(disease='High vector presence - risk of viral spread', confidence=0.7)
+VECTOR_REC = dict(treatment='Vectors detected: control aphids/whiteflies using IPM (neem/biocontrol/soft insecticides); use reflective mulches or yellow sticky traps')
+
+NO_DATA_REC = dict(general='Insufficient symptom/lab data to provide a targeted recommendation. Collect more info: detailed symptoms, lab NPK, recent weather.')
+
+N_FERTILIZER = 'Apply nitrogen fertilizer (e.g., Urea or CAN) - consider split dosing'
+P_FERTILIZER = 'Apply phosphorus fertilizer (e.g., Single Super Phosphate) at planting or as recommended'
+K_FERTILIZER = 'Apply potassium fertilizer (e.g., MOP) to boost fruiting/stress tolerance'
+NPK_ADEQUATE = 'Soil NPK levels are adequate; maintain balanced fertilization and monitor'
+STAGE_N_ADVICE = 'Increase nitrogen to support vegetative growth (split applications)'
+STAGE_K_ADVICE = 'Increase potassium to support flowering/fruition'
+# Fertilizer advice for each combination of low N/P/K, indexed by the mask
+# Nlow << 2 | Plow << 1 | Klow
+FERT_TABLE = tuple(
+    tuple(text for bit, text in ((4, N_FERTILIZER), (2, P_FERTILIZER), (1, K_FERTILIZER)) if mask & bit)
+    or (NPK_ADEQUATE,)
+    for mask in range(8))
+PH_ACIDIC_NOTE = 'Soil is acidic (pH={:.2f}). Consider liming to raise pH.'
+PH_ALKALINE_NOTE = 'Soil is alkaline (pH={:.2f}). Consider sulfur or acidifying amendments.'
 
 # -------------------------
 # Helper functions
 # -------------------------
+def npk_level(x):
+    """Qualitative level of a single N, P or K lab value."""
+    if x < NPK_LOW:
+        return 'low'
+    elif x < NPK_HIGH:
+        return 'medium'
+    else:
+        return 'high'
+
+# Lab values entered in the UI are whole ppm in 0..500, so their levels are
+# precomputed; anything else (floats, larger values) falls back to npk_level()
+NPK_LEVELS = tuple(npk_level(x) for x in range(501))
+
 def interpret_npk(N, P, K):
     """Return qualitative levels for simple thresholding (very simplified)."""
-    # thresholds are illustrative — adapt to real lab ranges & crop needs
-    def level(x):
-        if x < 50:
-            return 'low'
-        elif x < 150:
-            return 'medium'
+    try:
+        if N >= 0 and P >= 0 and K >= 0:
+            return NPK_LEVELS[N], NPK_LEVELS[P], NPK_LEVELS[K]
+    except (IndexError, TypeError):
+        pass
+    return npk_level(N), npk_level(P), npk_level(K)
+
+def fact_key(fact):
+    """Hashable content of a fact (its class and public slots), ignoring its id."""
+    return type(fact), frozenset((k, v) for k, v in fact.items() if not Fact.is_special(k))
+
+def concludes(*diseases):
+    """Tag a rule with the Diagnosis diseases it can declare (see HEAD_INDEX)."""
+    def tag(rule):
+        rule.concludes = diseases
+        return rule
+    return tag
+
+def soil_ph_rule(acidic, alkaline):
+    """Build the soil pH rule with the given thresholds baked into its pattern."""
+    @Rule(AS.soil << Soil(type=MATCH.stype,
+                          ph=MATCH.ph & ~L(None) & (P(partial(gt, acidic)) | P(partial(lt, alkaline)))),
+          salience=1)
+    def soil_ph_issue(self, soil, stype, ph):
+        """Detect extreme soil pH issues and suggest adjustment."""
+        if ph < acidic:
+            note = PH_ACIDIC_NOTE.format(ph)
         else:
-            return 'high'
-    return level(N), level(P), level(K)
+            note = PH_ALKALINE_NOTE.format(ph)
+        self.declare(Recommendation(soil_ph_note=note))
+    return soil_ph_issue
+
+class HeapAgenda(Agenda):
+    """Agenda kept as a binary heap, which also remembers the activation
+    currently being fired.
+
+    Entries order like DepthStrategy's sorted list (highest salience first,
+    then the activation with the most recent facts, then the newest), so the
+    next activation is a heappop instead of a list scan. Removed activations
+    are only marked dead and skipped when they reach the top.
+    """
+    def __init__(self, activations=()):
+        self._heap = []
+        self._entries = {}      # pending activation -> its heap entry
+        self._seq = count()
+        self.current = None
+        for act in activations:
+            self.push(act)
+
+    @property
+    def activations(self):
+        """Pending activations, the next one to fire last (as in Agenda)."""
+        return [entry[-1] for entry in sorted(self._heap, reverse=True) if entry[-1] is not None]
+
+    def push(self, act):
+        salience, facts = act.key
+        # Negated fact ids make the most recent facts sort first; the trailing
+        # 1 keeps a shorter id list after the longer one it is a prefix of
+        entry = [-salience, tuple(-f for f in facts) + (1,), -next(self._seq), act]
+        self._entries[act] = entry
+        heapq.heappush(self._heap, entry)
+
+    def pending(self):
+        """Whether any activation is still waiting to fire."""
+        return bool(self._entries)
+
+    def remove(self, act):
+        entry = self._entries.pop(act, None)
+        if entry is not None:
+            entry[-1] = None
+
+    def get_next(self):
+        self.current = None
+        while self._heap:
+            entry = heapq.heappop(self._heap)
+            act = entry[-1]
+            if act is not None:
+                if self._entries.get(act) is entry:
+                    del self._entries[act]
+                self.current = act
+                break
+        return self.current
+
+class HeapStrategy(DepthStrategy):
+    """DepthStrategy's conflict resolution on a HeapAgenda."""
+    def _update_agenda(self, agenda, added, removed):
+        if not isinstance(agenda, HeapAgenda):
+            # KnowledgeEngine.reset() fills a plain Agenda before we swap it
+            return super()._update_agenda(agenda, added, removed)
+        for act in removed:
+            act.key = self.get_key(act)
+            agenda.remove(act)
+        for act in added:
+            act.key = self.get_key(act)
+            agenda.push(act)
+
+def rule_patterns(ce):
+    """Yield every fact pattern inside a rule or conditional element."""
+    if isinstance(ce, Fact):
+        yield ce
+    elif isinstance(ce, ConditionalElement):
+        for child in ce:
+            yield from rule_patterns(child)
+
+@lru_cache(maxsize=None)
+def build_alpha_filter(engine_cls):
+    """Collect the constant-equality constraints of the rules of `engine_cls`,
+    as a pre-filter for declare().
+
+    Returns (keys, filtered) where keys holds a (fact class, slot, value)
+    for every such constraint, and filtered holds the fact classes whose
+    every pattern has at least one: a fact of those classes that hits none
+    of the keys cannot match any rule.
+    """
+    keys = set()
+    matched, unfilterable = set(), set()
+    for _, rule in inspect.getmembers(engine_cls):
+        if not isinstance(rule, Rule):
+            continue
+        for pattern in rule_patterns(rule):
+            cls = type(pattern)
+            matched.add(cls)
+            constants = [(k, v) for k, v in pattern.items()
+                         if not Fact.is_special(k) and not isinstance(v, ConditionalElement)]
+            if not constants:
+                unfilterable.add(cls)
+            keys.update((cls, k, v) for k, v in constants)
+    return frozenset(keys), frozenset(matched - unfilterable)
 
 # -------------------------
 # The Expert Engine
 # -------------------------
 class AgriSenseEngine(KnowledgeEngine):
+    __strategy__ = HeapStrategy
+    fallback = NO_DATA_REC   # declared by run() when no rule concluded anything
+
+    def __init__(self):
+        super().__init__()
+        self.agenda = HeapAgenda()
+        self._inputs = {}    # fact class -> (fact_key, declared input fact)
+        self._support = {}   # derived fact id -> ids of the facts it was concluded from
+        self._by_type = {}   # fact class -> declared facts of that class
+        self._seen = set()   # fact_key of every declared fact
+        self._fallback = None    # the declared fallback Recommendation, if any
+
     # Prioritize diagnosis rules (higher salience) over fertilizer rules (lower)
-    @Rule(Symptoms(leaf_spots=True, powdery_white=True))
+    @concludes(POWDERY_DIAG['disease'])
+    @Rule(Symptoms(leaf_spots=True, powdery_white=True), salience=10)
     def powdery_mildew(self):
-        self.declare(Diagnosis(disease='Powdery Mildew',
-                               confidence=0.8,
-                               notes='Look for white powder on leaf surfaces'))
-        self.declare(Recommendation(treatment='Apply fungicide targeting powdery mildew; improve air circulation; remove heavily infected leaves'))
+        self.declare(Diagnosis(**POWDERY_DIAG))
+        self.declare(Recommendation(**POWDERY_REC))
 
+    @concludes(BLIGHT_DIAG['disease'])
     @Rule(Symptoms(leaf_spots=True, stem_lesions=True),
-          Weather(humidity=P(lambda h: h > 75)))
+          Weather(humidity=P(ABOVE_BLIGHT_HUMIDITY)),
+          salience=10)
     def blight_like(self):
-        self.declare(Diagnosis(disease='Blight-like infection (possible bacterial/fungal)',
-                               confidence=0.85,
-                               notes='Leaf spots + stem lesions; wet humid weather favors blights'))
-        self.declare(Recommendation(treatment='Use appropriate bactericide/fungicide; remove infected material; avoid overhead irrigation'))
+        self.declare(Diagnosis(**BLIGHT_DIAG))
+        self.declare(Recommendation(**BLIGHT_REC))
 
-    @Rule(Symptoms(mosaic=True))
+    @concludes(MOSAIC_DIAG['disease'])
+    @Rule(Symptoms(mosaic=True), salience=10)
     def viral_mosaic(self):
-        self.declare(Diagnosis(disease='Viral Mosaic',
-                               confidence=0.9,
-                               notes='Mosaic patterns on leaves often indicate virus; vector control important'))
-        self.declare(Recommendation(treatment='No chemical cure for virus; rogue and destroy infected plants; control aphids/whiteflies'))
+        self.declare(Diagnosis(**MOSAIC_DIAG))
+        self.declare(Recommendation(**MOSAIC_REC))
 
+    @concludes(INSECT_DIAG['disease'])
     @Rule(Symptoms(wilting=True),
-          PestPresence(caterpillars=True))
+          PestPresence(caterpillars=True),
+          salience=10)
     def insect_damage_wilt(self):
-        self.declare(Diagnosis(disease='Insect damage (larval feeding)',
-                               confidence=0.75,
-                               notes='Wilting with caterpillars suggests stem/root boring or heavy defoliation'))
-        self.declare(Recommendation(treatment='Inspect for larvae; use biological control (Bt) or targeted insecticide; remove affected parts'))
+        self.declare(Diagnosis(**INSECT_DIAG))
+        self.declare(Recommendation(**INSECT_REC))
 
+    @concludes(NITROGEN_DIAG['disease'])
     @Rule(Symptoms(yellowing=True),
-          Lab(N=P(lambda n: n < 50)))
+          Lab(N=P(BELOW_NPK_LOW)),
+          salience=10)
     def nitrogen_deficiency_symptom(self):
-        self.declare(Diagnosis(disease='Nutrient deficiency - Nitrogen',
-                               confidence=0.8,
-                               notes='Yellowing, especially older leaves, suggests N deficiency'))
-        self.declare(Recommendation(treatment='Top-dress with nitrogenous fertilizer (e.g., urea) as per crop need; split applications'))
+        self.declare(Diagnosis(**NITROGEN_DIAG))
+        self.declare(Recommendation(**NITROGEN_REC))
 
-    @Rule(AS.lab << Lab(N=MATCH.N, P=MATCH.P, K=MATCH.K))
-    def fertilizer_npk_evaluation(self, lab, N, P, K):
-        """Generic fertilizer recommendation based on lab values and an optional crop fact."""
+    @Rule(AS.lab << Lab(N=MATCH.N, P=MATCH.P, K=MATCH.K),
+          salience=20)
+    def lab_levels(self, lab, N, P, K):
+        """Interpret the lab NPK values once; the fertilizer rules share the result."""
         Nlvl, Plvl, Klvl = interpret_npk(N, P, K)
-        recs = []
-        if Nlvl == 'low':
-            recs.append('Apply nitrogen fertilizer (e.g., Urea or CAN) - consider split dosing')
-        if Plvl == 'low':
-            recs.append('Apply phosphorus fertilizer (e.g., Single Super Phosphate) at planting or as recommended')
-        if Klvl == 'low':
-            recs.append('Apply potassium fertilizer (e.g., MOP) to boost fruiting/stress tolerance')
-        if not recs:
-            recs.append('Soil NPK levels are adequate; maintain balanced fertilization and monitor')
+        self.declare(LabLevels(Nlvl=Nlvl, Plvl=Plvl, Klvl=Klvl))
+
+    @Rule(LabLevels(Nlvl=MATCH.Nlvl, Plvl=MATCH.Plvl, Klvl=MATCH.Klvl),
+          salience=1)
+    def fertilizer_npk_evaluation(self, Nlvl, Plvl, Klvl):
+        """Generic fertilizer recommendation based on lab values and an optional crop fact."""
+        mask = (Nlvl == 'low') << 2 | (Plvl == 'low') << 1 | (Klvl == 'low')
+        recs = FERT_TABLE[mask]
         self.declare(Recommendation(fertilizer_recommendations=recs))
 
     @Rule(AS.crop << Crop(name=MATCH.name, stage=MATCH.stage),
-          Lab(N=MATCH.N, P=MATCH.P, K=MATCH.K))
-    def crop_stage_specific(self, crop, name, stage, N, P, K):
+          LabLevels(Nlvl=MATCH.Nlvl, Klvl=MATCH.Klvl),
+          salience=1)
+    def crop_stage_specific(self, crop, name, stage, Nlvl, Klvl):
         """Refine N requirement by crop stage (illustrative guidance)."""
         # Simplified: vegetative needs more N; flowering/fruiting needs K
         advice = []
-        Nlvl, Plvl, Klvl = interpret_npk(N, P, K)
         if stage == 'vegetative' and Nlvl == 'low':
-            advice.append('Increase nitrogen to support vegetative growth (split applications)')
+            advice.append(STAGE_N_ADVICE)
         if stage in ('flowering', 'fruiting') and Klvl == 'low':
-            advice.append('Increase potassium to support flowering/fruition')
+            advice.append(STAGE_K_ADVICE)
         if advice:
             self.declare(Recommendation(stage_advice=advice))
 
-    @Rule(AS.soil << Soil(type=MATCH.stype, ph=MATCH.ph),
-          TEST(lambda ph: ph is not None and (ph < 5.5 or ph > 7.8)))
-    def soil_ph_issue(self, soil, stype, ph):
-        """Detect extreme soil pH issues and suggest adjustment."""
-        if ph < 5.5:
-            note = 'Soil is acidic (pH={:.2f}). Consider liming to raise pH.'.format(ph)
-        else:
-            note = 'Soil is alkaline (pH={:.2f}). Consider sulfur or acidifying amendments.'.format(ph)
-        self.declare(Recommendation(soil_ph_note=note))
+    soil_ph_issue = soil_ph_rule(PH_ACIDIC, PH_ALKALINE)
 
-    @Rule(PestPresence(aphids=True) | PestPresence(whiteflies=True))
+    @concludes(VECTOR_DIAG['disease'])
+    @Rule(PestPresence(aphids=True) | PestPresence(whiteflies=True),
+          salience=10)
     def vector_warning(self):
         """Vector-borne disease prevention rule."""
-        self.declare(Recommendation(treatment='Vectors detected: control aphids/whiteflies using IPM (neem/biocontrol/soft insecticides); use reflective mulches or yellow sticky traps'))
-        self.declare(Diagnosis(disease='High vector presence - risk of viral spread', confidence=0.7))
+        self.declare(Recommendation(**VECTOR_REC))
+        self.declare(Diagnosis(**VECTOR_DIAG))
+
+    def run(self, steps=float('inf')):
+        """Fire the rules, then declare the `fallback` recommendation if none of
+        them concluded anything (or retract it if they now have).
+
+        Checking the result buckets once here replaces a
+        NOT(Diagnosis()) / NOT(Recommendation()) rule, whose negated patterns
+        the matcher had to re-evaluate on every working memory change.
+        """
+        super().run(steps)
+        # A step budget (or halt()) can stop the run with rules left to fire,
+        # including ones activated by the last firing that the matcher has not
+        # queued yet; the fallback only applies once nothing is pending
+        self.strategy.update_agenda(self.agenda, *self.get_activations())
+        if self.agenda.pending():
+            return
+        concluded = (len(self._by_type.get(Diagnosis, ()))
+                     + len(self._by_type.get(Recommendation, ()))
+                     - (self._fallback is not None))
+        if concluded and self._fallback is not None:
+            self.retract(self._fallback)
+            self._fallback = None
+        elif not concluded and self._fallback is None and self.fallback is not None:
+            self._fallback = self.declare(Recommendation(**self.fallback))
+
+    def reset(self, **kwargs):
+        super().reset(**kwargs)
+        # KnowledgeEngine.reset() installs a plain Agenda; keep its activations
+        self.agenda = HeapAgenda(self.agenda.activations)
+        self._inputs = {}
+        self._support = {}
+        self._by_type = {}
+        self._seen = set()
+        self._fallback = None
+
+    def declare(self, *facts):
+        """Declare facts, bucketing them by class and remembering which facts a
+        rule concluded them from.
+
+        A fact whose content is already in working memory is skipped before it
+        reaches the matcher (e.g. vector_warning firing for both aphids and
+        whiteflies), so it cannot add activations or duplicate results. So is
+        a fact that no rule can match according to build_alpha_filter() (e.g.
+        Symptoms with every slot False), which spares the Rete network a walk
+        through every Symptoms test.
+        """
+        keys, filtered = build_alpha_filter(type(self))
+        last = None
+        for fact in facts:
+            cls = type(fact)
+            if cls in filtered and not any((cls, k, v) in keys for k, v in fact.items()):
+                last = None
+                continue
+            key = fact_key(fact)
+            if key in self._seen:
+                last = None
+                continue
+            last = super().declare(fact)
+            if last is None:
+                continue
+            self._seen.add(key)
+            self._by_type.setdefault(type(last), []).append(last)
+            activation = self.agenda.current
+            if self.running and activation is not None:
+                self._support[last.__factid__] = frozenset(f.__factid__ for f in activation.facts)
+        return last
+
+    def retract(self, idx_or_declared_fact):
+        idx = idx_or_declared_fact
+        if not isinstance(idx, int):
+            idx = idx.__factid__
+        fact = self.facts.get(idx)
+        super().retract(idx)
+        self._by_type[type(fact)].remove(fact)
+        self._seen.discard(fact_key(fact))
+
+    def update(self, *facts):
+        """Make `facts` (one per fact class) the current inputs, incrementally.
 
-    @Rule(AND(NOT(Diagnosis()), NOT(Recommendation())))
-    def no_data(self):
-        """Fallback if no diagnosis or recommendations were produced."""
-        self.declare(Recommendation(general='Insufficient symptom/lab data to provide a targeted recommendation. Collect more info: detailed symptoms, lab NPK, recent weather.'))
+        Only inputs whose content changed since the previous call are retracted
+        and re-declared, together with everything concluded from them, so the
+        next run() fires just the rules affected by the change. Inputs of a
+        class missing from `facts` are retracted the same way.
+        """
+        if not self.facts:
+            self.reset()
+        current = {type(fact) for fact in facts}
+        for cls in [cls for cls in self._inputs if cls not in current]:
+            previous = self._inputs.pop(cls)
+            if previous[1] is not None:
+                self._retract_with_consequences(previous[1].__factid__)
+        for fact in facts:
+            key = fact_key(fact)
+            previous = self._inputs.get(type(fact))
+            if previous is not None and previous[0] == key:
+                continue
+            if previous is not None and previous[1] is not None:
+                self._retract_with_consequences(previous[1].__factid__)
+            self._inputs[type(fact)] = (key, self.declare(fact))
+
+    def _retract_with_consequences(self, idx):
+        self._support.pop(idx, None)
+        self.retract(idx)
+        self._retract_consequences(idx)
+
+    def _retract_consequences(self, idx):
+        """Retract, recursively, every fact concluded from fact `idx`."""
+        for derived, support in list(self._support.items()):
+            if idx in support and derived in self.facts:
+                self._retract_with_consequences(derived)
 
     # Optional: collect and print results as they are declared
     def get_results(self):
-        diagnoses = [f for f in self.facts.values() if isinstance(f, Diagnosis)]
-        recs = [f for f in self.facts.values() if isinstance(f, Recommendation)]
+        diagnoses = list(self._by_type.get(Diagnosis, ()))
+        recs = list(self._by_type.get(Recommendation, ()))
         return diagnoses, recs
 
+# -------------------------
+# Backward chaining ("what-if" checks of a single hypothesis)
+# -------------------------
+def restrict(engine_cls, rule_names, cls_name=None, **attrs):
+    """Return a subclass of `engine_cls` that only carries the rules in `rule_names`,
+    plus the class attributes `attrs` (e.g. replacement rules).
+    """
+    dropped = {name: None
+               for name, member in inspect.getmembers(engine_cls)
+               if isinstance(member, Rule) and name not in rule_names}
+    return type(cls_name or engine_cls.__name__, (engine_cls,), {**dropped, **attrs})
+
+def build_head_index(engine_cls):
+    """Map each diagnosis to the rules that can conclude it, from the @concludes tags."""
+    index = {}
+    for name, member in inspect.getmembers(engine_cls):
+        for disease in getattr(member, 'concludes', ()):
+            index.setdefault(disease, []).append(member)
+    return index
+
+HEAD_INDEX = build_head_index(AgriSenseEngine)
+HYPOTHESES = tuple(sorted(HEAD_INDEX))
+
+@lru_cache(maxsize=None)
+def hypothesis_engine(crop, disease):
+    """Engine class for `crop` (see crop_engine) holding only the rules whose
+    head can conclude `disease` (and no fallback recommendation)."""
+    rules = {rule.__name__ for rule in HEAD_INDEX[disease]} - CROP_EXCLUDED_RULES.get(crop, set())
+    if not rules:
+        raise ValueError("{!r} is not assessed for {!r}".format(disease, crop))
+    return restrict(crop_engine(crop), rules, fallback=None)
+
+def backward_check(crop, disease, *facts, engine=None):
+    """Check whether `facts` support `disease` for `crop` without running the
+    full rule set.
+
+    Returns (diagnoses, recs) as produced by the rules that can conclude
+    `disease`; an empty diagnoses list means the hypothesis is not supported.
+    Pass an instance of hypothesis_engine(crop, disease) as `engine` to reuse
+    its Rete network across checks; it is reset first.
+    """
+    if engine is None:
+        engine = hypothesis_engine(crop, disease)()
+    engine.reset()
+    engine.declare(*facts)
+    engine.run()
+    return engine.get_results()
+
+# -------------------------
+# Crop-specialized engines
+# -------------------------
+RULE_NAMES = frozenset(name for name, member in inspect.getmembers(AgriSenseEngine)
+                       if isinstance(member, Rule))
+
+@lru_cache(maxsize=None)
+def crop_engine(crop):
+    """Engine class for `crop`: AgriSenseEngine without the rules excluded for
+    the crop and with its pH thresholds compiled into the soil pH rule.
+    Crops without any specialization get AgriSenseEngine itself.
+    """
+    excluded = CROP_EXCLUDED_RULES.get(crop, set())
+    if not excluded and crop not in CROP_PH_RANGE:
+        return AgriSenseEngine
+    rules = {}
+    if crop in CROP_PH_RANGE:
+        rules['soil_ph_issue'] = soil_ph_rule(*CROP_PH_RANGE[crop])
+    return restrict(AgriSenseEngine, RULE_NAMES - excluded,
+                    cls_name=crop.title() + AgriSenseEngine.__name__, **rules)
+
+@lru_cache(maxsize=None)
+def crop_hypotheses(crop):
+    """The HYPOTHESES that `crop`'s engine has at least one rule for."""
+    excluded = CROP_EXCLUDED_RULES.get(crop, set())
+    return tuple(disease for disease in HYPOTHESES
+                 if any(rule.__name__ not in excluded for rule in HEAD_INDEX[disease]))
+
 # -------------------------
 # Demo / Example usage
 # -------------------------
+def print_fact(fact):
+    """Print the set public slots of a result fact, one per line."""
+    bullet = '- '
+    for k in fact._PUBLIC_FIELDS:
+        value = fact.get(k)
+        if value is not None:
+            print(f"{bullet}{k}: {value}")
+            bullet = '  '
+
 def main():
     engine = AgriSenseEngine()
     engine.reset()
@@ -183,11 +609,11 @@ def main():
     print("\n--- Diagnoses ---")
     for d in diagnoses:
         # d is a Fact object with slots like disease, confidence, notes
-        print({k: v for k, v in d.items() if k != '__factid__'})
+        print_fact(d)
 
     print("\n--- Recommendations ---")
     for r in recs:
-        print({k: v for k, v in r.items() if k != '__factid__'})
+        print_fact(r)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,283 @@
+"""
+AgriSense fast path - the AgriSenseEngine rule set compiled with Numba
+Requires: numba  (pip install numba)
+
+infer() evaluates the same rules as agrisense.AgriSenseEngine as one straight
+if-chain over scalar inputs, with no facts, agenda or pattern matching, and
+returns bitmasks of the diagnoses/recommendations that fired, specialized
+for a crop like agrisense.crop_engine() via crop_profile(). decode() turns
+the masks back into the same slots the engine's Diagnosis/Recommendation
+facts carry, so the Streamlit UI can render either result.
+
+analyze_batch() diagnoses a whole table of samples at once, evaluating each
+diagnosis rule as NumPy operations over columns.
+
+Thresholds and output texts are imported from agrisense.py, so both paths
+always agree. Numba bakes those globals into the machine code it compiles,
+so infer() is compiled once per process rather than cached on disk, where
+the cache would only be invalidated by edits to this file.
+"""
+
+import numpy as np
+import pandas as pd
+from numba import njit
+
+from agrisense import (AgriSenseEngine, Symptoms, Weather, Lab, PestPresence,
+                       STAGES, NPK_LOW, HUMIDITY_BLIGHT, PH_ACIDIC, PH_ALKALINE,
+                       CROP_PH_RANGE, CROP_EXCLUDED_RULES,
+                       POWDERY_DIAG, POWDERY_REC, BLIGHT_DIAG, BLIGHT_REC,
+                       MOSAIC_DIAG, MOSAIC_REC, INSECT_DIAG, INSECT_REC,
+                       NITROGEN_DIAG, NITROGEN_REC, VECTOR_DIAG, VECTOR_REC, NO_DATA_REC,
+                       N_FERTILIZER, P_FERTILIZER, K_FERTILIZER, NPK_ADEQUATE,
+                       STAGE_N_ADVICE, STAGE_K_ADVICE, PH_ACIDIC_NOTE, PH_ALKALINE_NOTE)
+
+# -------------------------
+# Ids (bit positions in the returned masks)
+# -------------------------
+VEGETATIVE, FLOWERING, FRUITING = map(STAGES.index, ('vegetative', 'flowering', 'fruiting'))
+
+# Diagnoses, in rule priority order
+D_POWDERY_MILDEW, D_BLIGHT, D_VIRAL_MOSAIC, D_INSECT_DAMAGE, D_NITROGEN, D_VECTORS = range(6)
+
+# Recommendations: one treatment per diagnosis rule, then fertilizer,
+# stage, soil pH advice and the no-data fallback
+(R_POWDERY_MILDEW, R_BLIGHT, R_VIRAL_MOSAIC, R_INSECT_DAMAGE, R_NITROGEN, R_VECTORS,
+ R_FERT_N, R_FERT_P, R_FERT_K, R_FERT_ADEQUATE,
+ R_STAGE_N, R_STAGE_K,
+ R_PH_ACIDIC, R_PH_ALKALINE,
+ R_GENERAL) = range(15)
+
+ID_TO_DIAGNOSIS = {
+    D_POWDERY_MILDEW: POWDERY_DIAG,
+    D_BLIGHT: BLIGHT_DIAG,
+    D_VIRAL_MOSAIC: MOSAIC_DIAG,
+    D_INSECT_DAMAGE: INSECT_DIAG,
+    D_NITROGEN: NITROGEN_DIAG,
+    D_VECTORS: VECTOR_DIAG,
+}
+
+ID_TO_TEXT = {
+    R_POWDERY_MILDEW: POWDERY_REC['treatment'],
+    R_BLIGHT: BLIGHT_REC['treatment'],
+    R_VIRAL_MOSAIC: MOSAIC_REC['treatment'],
+    R_INSECT_DAMAGE: INSECT_REC['treatment'],
+    R_NITROGEN: NITROGEN_REC['treatment'],
+    R_VECTORS: VECTOR_REC['treatment'],
+    R_FERT_N: N_FERTILIZER,
+    R_FERT_P: P_FERTILIZER,
+    R_FERT_K: K_FERTILIZER,
+    R_FERT_ADEQUATE: NPK_ADEQUATE,
+    R_STAGE_N: STAGE_N_ADVICE,
+    R_STAGE_K: STAGE_K_ADVICE,
+    R_PH_ACIDIC: PH_ACIDIC_NOTE,
+    R_PH_ALKALINE: PH_ALKALINE_NOTE,
+    R_GENERAL: NO_DATA_REC['general'],
+}
+
+TREATMENTS = (R_POWDERY_MILDEW, R_BLIGHT, R_VIRAL_MOSAIC, R_INSECT_DAMAGE, R_NITROGEN, R_VECTORS)
+FERTILIZERS = (R_FERT_N, R_FERT_P, R_FERT_K, R_FERT_ADEQUATE)
+
+# (diagnosis mask, recommendation mask) of what each AgriSenseEngine rule can
+# conclude, used to leave out the rules a crop excludes
+RULE_MASKS = {
+    'powdery_mildew': (1 << D_POWDERY_MILDEW, 1 << R_POWDERY_MILDEW),
+    'blight_like': (1 << D_BLIGHT, 1 << R_BLIGHT),
+    'viral_mosaic': (1 << D_VIRAL_MOSAIC, 1 << R_VIRAL_MOSAIC),
+    'insect_damage_wilt': (1 << D_INSECT_DAMAGE, 1 << R_INSECT_DAMAGE),
+    'nitrogen_deficiency_symptom': (1 << D_NITROGEN, 1 << R_NITROGEN),
+    'vector_warning': (1 << D_VECTORS, 1 << R_VECTORS),
+    'fertilizer_npk_evaluation': (0, sum(1 << i for i in FERTILIZERS)),
+    'crop_stage_specific': (0, 1 << R_STAGE_N | 1 << R_STAGE_K),
+    'lab_levels': (0, sum(1 << i for i in FERTILIZERS) | 1 << R_STAGE_N | 1 << R_STAGE_K),
+    'soil_ph_issue': (0, 1 << R_PH_ACIDIC | 1 << R_PH_ALKALINE),
+}
+
+def crop_profile(crop):
+    """The leading infer() arguments for `crop`: (ph_acidic, ph_alkaline,
+    skip_diag, skip_rec), from CROP_PH_RANGE and CROP_EXCLUDED_RULES."""
+    ph_acidic, ph_alkaline = CROP_PH_RANGE.get(crop, (PH_ACIDIC, PH_ALKALINE))
+    skip_diag = skip_rec = 0
+    for rule in CROP_EXCLUDED_RULES.get(crop, ()):
+        diag, rec = RULE_MASKS[rule]
+        skip_diag |= diag
+        skip_rec |= rec
+    return ph_acidic, ph_alkaline, skip_diag, skip_rec
+
+# -------------------------
+# Compiled rules
+# -------------------------
+@njit
+def infer(ph_acidic, ph_alkaline, skip_diag, skip_rec,
+          stage, ph, N, P, K, humidity,
+          leaf_spots, yellowing, wilting, stem_lesions, mosaic, powdery_white,
+          aphids, caterpillars, whiteflies):
+    """Return (diagnosis_mask, recommendation_mask); `stage` is an index into STAGES.
+
+    The first four arguments specialize the rules for a crop (see
+    crop_profile()): its soil pH range and the bits of the rules it excludes.
+    """
+    diag = 0
+    rec = 0
+
+    # Diagnosis rules
+    if leaf_spots and powdery_white:
+        diag |= 1 << D_POWDERY_MILDEW
+        rec |= 1 << R_POWDERY_MILDEW
+    if leaf_spots and stem_lesions and humidity > HUMIDITY_BLIGHT:
+        diag |= 1 << D_BLIGHT
+        rec |= 1 << R_BLIGHT
+    if mosaic:
+        diag |= 1 << D_VIRAL_MOSAIC
+        rec |= 1 << R_VIRAL_MOSAIC
+    if wilting and caterpillars:
+        diag |= 1 << D_INSECT_DAMAGE
+        rec |= 1 << R_INSECT_DAMAGE
+    if yellowing and N < NPK_LOW:
+        diag |= 1 << D_NITROGEN
+        rec |= 1 << R_NITROGEN
+    if aphids or whiteflies:
+        diag |= 1 << D_VECTORS
+        rec |= 1 << R_VECTORS
+
+    # Fertilizer rules (levels as in interpret_npk)
+    n_low = N < NPK_LOW
+    p_low = P < NPK_LOW
+    k_low = K < NPK_LOW
+    if n_low:
+        rec |= 1 << R_FERT_N
+    if p_low:
+        rec |= 1 << R_FERT_P
+    if k_low:
+        rec |= 1 << R_FERT_K
+    if not n_low and not p_low and not k_low:
+        rec |= 1 << R_FERT_ADEQUATE
+    if stage == VEGETATIVE and n_low:
+        rec |= 1 << R_STAGE_N
+    if (stage == FLOWERING or stage == FRUITING) and k_low:
+        rec |= 1 << R_STAGE_K
+
+    # Soil pH rule
+    if ph < ph_acidic:
+        rec |= 1 << R_PH_ACIDIC
+    elif ph > ph_alkaline:
+        rec |= 1 << R_PH_ALKALINE
+
+    diag &= ~skip_diag
+    rec &= ~skip_rec
+    if diag == 0 and rec == 0:
+        rec |= 1 << R_GENERAL
+    return diag, rec
+
+# -------------------------
+# Rendering
+# -------------------------
+def decode(diag, rec, ph):
+    """Turn infer()'s masks into lists of Diagnosis/Recommendation-like dicts."""
+    diagnoses = [dict(ID_TO_DIAGNOSIS[i]) for i in sorted(ID_TO_DIAGNOSIS) if diag >> i & 1]
+    recs = [{'treatment': ID_TO_TEXT[i]} for i in TREATMENTS if rec >> i & 1]
+
+    fertilizer = [ID_TO_TEXT[i] for i in FERTILIZERS if rec >> i & 1]
+    if fertilizer:
+        recs.append({'fertilizer_recommendations': fertilizer})
+    advice = [ID_TO_TEXT[i] for i in (R_STAGE_N, R_STAGE_K) if rec >> i & 1]
+    if advice:
+        recs.append({'stage_advice': advice})
+    for i in (R_PH_ACIDIC, R_PH_ALKALINE):
+        if rec >> i & 1:
+            recs.append({'soil_ph_note': ID_TO_TEXT[i].format(ph)})
+    if rec >> R_GENERAL & 1:
+        recs.append({'general': ID_TO_TEXT[R_GENERAL]})
+    return diagnoses, recs
+
+# -------------------------
+# Batch analysis
+# -------------------------
+SYMPTOM_COLUMNS = ('leaf_spots', 'yellowing', 'wilting', 'stem_lesions', 'mosaic', 'powdery_white')
+PEST_COLUMNS = ('aphids', 'caterpillars', 'whiteflies')
+NUMBER_COLUMNS = ('humidity', 'N')
+BATCH_COLUMNS = SYMPTOM_COLUMNS + PEST_COLUMNS + NUMBER_COLUMNS
+DIAGNOSES = tuple(ID_TO_DIAGNOSIS[i]['disease'] for i in sorted(ID_TO_DIAGNOSIS))
+
+# Text accepted in a flag column (compared case-insensitively)
+FLAG_TEXT = {'true': True, 'false': False, '1': True, '0': False, '1.0': True, '0.0': False}
+
+def parse_flag(column):
+    """Parse a symptom/pest flag column into a bool array.
+
+    Accepts booleans, 0/1 (as numbers or text) and true/false text; missing
+    values count as False. Anything else raises ValueError, since e.g. the
+    text "no" would otherwise be truthy.
+    """
+    if pd.api.types.is_bool_dtype(column):
+        return column.fillna(False).to_numpy(dtype=bool)
+    missing = column.isna()
+    if pd.api.types.is_numeric_dtype(column):
+        parsed = column.mask(missing, 0)
+        valid = parsed.isin((0, 1))
+    else:
+        parsed = column.mask(missing, 'false').astype(str).str.strip().str.lower().map(FLAG_TEXT)
+        valid = parsed.notna()
+    if not valid.all():
+        raise ValueError("column {!r} must hold true/false or 1/0 flags, got {!r}"
+                         .format(column.name, column[~valid].iloc[0]))
+    return parsed.to_numpy(dtype=bool)
+
+def parse_number(column):
+    """Parse a humidity/N column into a numeric array (missing values as NaN).
+
+    Raises ValueError naming the column for text such as "85%".
+    """
+    try:
+        return pd.to_numeric(column, errors='raise').to_numpy()
+    except (ValueError, TypeError) as e:
+        raise ValueError("column {!r} must hold numbers: {}".format(column.name, e)) from None
+
+def analyze_batch(df, engine='numpy'):
+    """Diagnose every sample (row) of `df`.
+
+    `df` needs the BATCH_COLUMNS: the symptom and pest flags (see
+    parse_flag()), humidity (pct) and N (ppm) as numbers. Returns an int8 DataFrame with
+    one column per diagnosis (1 = diagnosed), indexed like `df`.
+
+    engine='numpy' evaluates each diagnosis rule as column-wise array
+    operations; engine='experta' runs AgriSenseEngine row by row.
+    """
+    if engine not in ('numpy', 'experta'):
+        raise ValueError("engine must be 'numpy' or 'experta', got {!r}".format(engine))
+    # Parsed once, so both engines see the same arrays
+    columns = {name: parse_flag(df[name]) for name in SYMPTOM_COLUMNS + PEST_COLUMNS}
+    columns.update((name, parse_number(df[name])) for name in NUMBER_COLUMNS)
+    if engine == 'numpy':
+        matrix = _diagnose_numpy(columns, len(df))
+    else:
+        matrix = _diagnose_experta(columns, len(df))
+    return pd.DataFrame(matrix, index=df.index, columns=DIAGNOSES)
+
+def _diagnose_numpy(columns, rows):
+    leaf_spots = columns['leaf_spots']
+    matrix = np.zeros((rows, len(DIAGNOSES)), dtype=np.int8)
+    matrix[:, D_POWDERY_MILDEW] = leaf_spots & columns['powdery_white']
+    matrix[:, D_BLIGHT] = leaf_spots & columns['stem_lesions'] & (columns['humidity'] > HUMIDITY_BLIGHT)
+    matrix[:, D_VIRAL_MOSAIC] = columns['mosaic']
+    matrix[:, D_INSECT_DAMAGE] = columns['wilting'] & columns['caterpillars']
+    matrix[:, D_NITROGEN] = columns['yellowing'] & (columns['N'] < NPK_LOW)
+    matrix[:, D_VECTORS] = columns['aphids'] | columns['whiteflies']
+    return matrix
+
+def _diagnose_experta(columns, rows):
+    column = {disease: i for i, disease in enumerate(DIAGNOSES)}
+    matrix = np.zeros((rows, len(DIAGNOSES)), dtype=np.int8)
+    engine = AgriSenseEngine()
+    humidity, N = columns['humidity'].tolist(), columns['N'].tolist()
+    for row in range(rows):
+        engine.reset()
+        engine.declare(
+            Symptoms(**{k: bool(columns[k][row]) for k in SYMPTOM_COLUMNS}),
+            PestPresence(**{k: bool(columns[k][row]) for k in PEST_COLUMNS}),
+            Weather(humidity=humidity[row]),
+            Lab(N=N[row]),
+        )
+        engine.run()
+        for d in engine.get_results()[0]:
+            matrix[row, column[d['disease']]] = 1
+    return matrix
@@ -1,7 +1,113 @@
 # agri_streamlit.py
+import threading
+
+import pandas as pd
 import streamlit as st
 from experta import *
-from agrisense import AgriSenseEngine, Crop, Soil, Lab, Symptoms, Weather, PestPresence
+from agrisense import (Crop, Soil, Lab, Symptoms, Weather, PestPresence,
+                       Diagnosis, Recommendation,
+                       CROPS, STAGES, SOIL_TYPES, MOISTURE_LEVELS,
+                       HEAD_INDEX, backward_check, crop_engine, crop_hypotheses, hypothesis_engine)
+from agrisense_fast import BATCH_COLUMNS, crop_profile, infer, decode, analyze_batch
+
+
+@st.cache_resource
+def get_engine(crop):
+    """Build the engine specialized for `crop` (and its Rete network) once for
+    all reruns and sessions.
+
+    The engine is shared, so the returned lock must be held from update() until
+    the results have been read.
+    """
+    return crop_engine(crop)(), threading.Lock()
+
+
+def make_facts(crop_name, crop_stage, soil_type, soil_ph, soil_moisture, N, P, K,
+               temp, humidity, recent_rain,
+               leaf_spots, yellowing, wilting, stem_lesions, mosaic, powdery_white, black_sooty,
+               aphids, mites, caterpillars, whiteflies):
+    """Build the six input facts from the widget values."""
+    return (
+        Crop(name=crop_name, stage=crop_stage),
+        Soil(type=soil_type, moisture=soil_moisture, ph=soil_ph),
+        Lab(N=N, P=P, K=K, ph=soil_ph),
+        Symptoms(
+            leaf_spots=leaf_spots,
+            yellowing=yellowing,
+            wilting=wilting,
+            stem_lesions=stem_lesions,
+            mosaic=mosaic,
+            powdery_white=powdery_white,
+            black_sooty=black_sooty
+        ),
+        Weather(temp=temp, humidity=humidity, recent_rain_days=recent_rain),
+        PestPresence(
+            aphids=aphids, mites=mites,
+            caterpillars=caterpillars, whiteflies=whiteflies
+        ),
+    )
+
+
+@st.cache_data(max_entries=256)
+def diagnose(inputs):
+    """Run the shared engine on `inputs` (the make_facts() arguments).
+
+    Results are memoized on the whole input tuple, so clicking "Run" again with
+    unchanged inputs is a cache lookup that never touches the engine.
+    """
+    engine, engine_lock = get_engine(inputs[0])
+    with engine_lock:
+        # Only the facts that changed since the previous run are
+        # re-declared (and their conclusions re-derived)
+        engine.update(*make_facts(*inputs))
+        engine.run()
+        diagnoses, recs = engine.get_results()
+    return tuple(d.as_dict() for d in diagnoses), tuple(r.as_dict() for r in recs)
+
+
+@st.cache_resource
+def get_hypothesis_engine(crop, disease):
+    """Build the `crop` engine holding only the rules that can conclude `disease`
+    once, like get_engine(); the same locking applies.
+    """
+    return hypothesis_engine(crop, disease)(), threading.Lock()
+
+
+@st.cache_data(max_entries=256)
+def check_hypothesis(disease, inputs):
+    """backward_check() `disease` on `inputs`, memoized like diagnose()."""
+    engine, engine_lock = get_hypothesis_engine(inputs[0], disease)
+    with engine_lock:
+        diagnoses, recs = backward_check(inputs[0], disease, *make_facts(*inputs), engine=engine)
+    return tuple(d.as_dict() for d in diagnoses), tuple(r.as_dict() for r in recs)
+
+def render_fertilizer(recommendations):
+    st.success("**Fertilizer Recommendations:**")
+    for f in recommendations:
+        st.write(f"🌱 {f}")
+
+
+# How each result slot is shown; slots without an entry fall back to st.write
+DIAGNOSIS_RENDER = {
+    'disease': lambda v: st.success(f"**Disease:** {v}"),
+    'confidence': lambda v: st.write(f"**Confidence:** {v}"),
+    'notes': st.info,
+}
+RECOMMENDATION_RENDER = {
+    'treatment': lambda v: st.warning(f"**Treatment:** {v}"),
+    'fertilizer_recommendations': render_fertilizer,
+    'stage_advice': lambda v: st.info(f"**Stage Advice:** {'; '.join(v)}"),
+    'soil_ph_note': lambda v: st.info(f"**Soil pH:** {v}"),
+    'general': st.info,
+}
+
+
+def render(result, fields, renderers):
+    """Show the set `fields` of a result (a fact or its as_dict()) with `renderers`."""
+    for field in fields:
+        value = result.get(field)
+        if value is not None:
+            renderers.get(field, st.write)(value)
 
 # Page style
 st.set_page_config(page_title="AgriSense - Crop Advisor", layout="wide")
@@ -13,124 +119,131 @@ st.write("---")
 # -------------------------------------------------------------------
 st.header("📥 Input Section")
 
-# ---- Crop Info ----
-col1, col2 = st.columns(2)
+# The crop is picked outside the form: it decides which hypotheses are offered
+crop_name = st.selectbox("🌾 Select Crop", CROPS)
 
-with col1:
-    st.subheader("🌾 Crop Information")
-    crop_name = st.selectbox("Select Crop", ["tomato", "wheat", "maize", "rice"])
-    crop_stage = st.selectbox("Growth Stage", ["vegetative", "flowering", "fruiting"])
+# The other inputs live in a form, so editing a widget does not rerun the
+# script; it reruns (and the engine runs) only when the form is submitted
+with st.form("agri_form"):
+    # ---- Crop Info ----
+    col1, col2 = st.columns(2)
 
-with col2:
-    st.subheader("🧪 Soil Information")
-    soil_type = st.selectbox("Soil Type", ["loam", "clay", "sandy"])
-    soil_ph = st.number_input("Soil pH", 4.0, 9.0, 6.5)
-    soil_moisture = st.selectbox("Soil Moisture", ["low", "adequate", "high"])
+    with col1:
+        st.subheader("🌾 Crop Information")
+        crop_stage = st.selectbox("Growth Stage", STAGES)
 
-# ---- Lab Values ----
-st.write("---")
-col3, col4, col5 = st.columns(3)
+    with col2:
+        st.subheader("🧪 Soil Information")
+        soil_type = st.selectbox("Soil Type", SOIL_TYPES)
+        soil_ph = st.number_input("Soil pH", 4.0, 9.0, 6.5)
+        soil_moisture = st.selectbox("Soil Moisture", MOISTURE_LEVELS)
 
-with col3:
-    st.subheader("⚗️ Nitrogen")
-    N = st.number_input("Nitrogen (ppm)", 0, 500, 50)
+    # ---- Lab Values ----
+    st.write("---")
+    col3, col4, col5 = st.columns(3)
 
-with col4:
-    st.subheader("🧫 Phosphorus")
-    P = st.number_input("Phosphorus (ppm)", 0, 500, 50)
+    with col3:
+        st.subheader("⚗️ Nitrogen")
+        N = st.number_input("Nitrogen (ppm)", 0, 500, 50)
 
-with col5:
-    st.subheader("🧯 Potassium")
-    K = st.number_input("Potassium (ppm)", 0, 500, 50)
+    with col4:
+        st.subheader("🧫 Phosphorus")
+        P = st.number_input("Phosphorus (ppm)", 0, 500, 50)
 
-# ---- Weather ----
-st.write("---")
-st.subheader("⛅ Weather Conditions")
-colW1, colW2, colW3 = st.columns(3)
+    with col5:
+        st.subheader("🧯 Potassium")
+        K = st.number_input("Potassium (ppm)", 0, 500, 50)
 
-with colW1:
-    temp = st.number_input("Temperature (°C)", -10, 50, 25)
+    # ---- Weather ----
+    st.write("---")
+    st.subheader("⛅ Weather Conditions")
+    colW1, colW2, colW3 = st.columns(3)
 
-with colW2:
-    humidity = st.number_input("Humidity (%)", 0, 100, 70)
+    with colW1:
+        temp = st.number_input("Temperature (°C)", -10, 50, 25)
 
-with colW3:
-    recent_rain = st.number_input("Recent Rain Days", 0, 30, 3)
+    with colW2:
+        humidity = st.number_input("Humidity (%)", 0, 100, 70)
 
-# ---- Symptoms ----
-st.write("---")
-st.subheader("🩺 Symptoms Observed")
+    with colW3:
+        recent_rain = st.number_input("Recent Rain Days", 0, 30, 3)
 
-colS1, colS2, colS3 = st.columns(3)
+    # ---- Symptoms ----
+    st.write("---")
+    st.subheader("🩺 Symptoms Observed")
 
-with colS1:
-    leaf_spots = st.checkbox("🔵 Leaf Spots")
-    yellowing = st.checkbox("🟡 Yellowing")
-    wilting = st.checkbox("🟤 Wilting")
+    colS1, colS2, colS3 = st.columns(3)
 
-with colS2:
-    stem_lesions = st.checkbox("🟥 Stem Lesions")
-    mosaic = st.checkbox("🟢 Mosaic Pattern")
-    powdery_white = st.checkbox("⚪ Powdery White")
+    with colS1:
+        leaf_spots = st.checkbox("🔵 Leaf Spots")
+        yellowing = st.checkbox("🟡 Yellowing")
+        wilting = st.checkbox("🟤 Wilting")
 
-with colS3:
-    black_sooty = st.checkbox("⚫ Black Sooty Mold")
-    st.write("")
+    with colS2:
+        stem_lesions = st.checkbox("🟥 Stem Lesions")
+        mosaic = st.checkbox("🟢 Mosaic Pattern")
+        powdery_white = st.checkbox("⚪ Powdery White")
 
-# ---- Pests ----
-st.write("---")
-st.subheader("🐛 Pest Presence")
-
-colP1, colP2, colP3, colP4 = st.columns(4)
-with colP1:
-    aphids = st.checkbox("🪲 Aphids")
-with colP2:
-    mites = st.checkbox("🕷️ Mites")
-with colP3:
-    caterpillars = st.checkbox("🐛 Caterpillars")
-with colP4:
-    whiteflies = st.checkbox("🦟 Whiteflies")
+    with colS3:
+        black_sooty = st.checkbox("⚫ Black Sooty Mold")
+        st.write("")
 
-# -------------------------------------------------------------------
-# 2) Run the Expert System
-# -------------------------------------------------------------------
-st.write("---")
-center = st.container()
-with center:
-    st.markdown("<h3 style='text-align:center;'>🔍 Analyze Inputs & Generate Recommendations</h3>", unsafe_allow_html=True)
-    run_btn = st.button("🚀 Run AgriSense Expert System", use_container_width=True)
+    # ---- Pests ----
+    st.write("---")
+    st.subheader("🐛 Pest Presence")
+
+    colP1, colP2, colP3, colP4 = st.columns(4)
+    with colP1:
+        aphids = st.checkbox("🪲 Aphids")
+    with colP2:
+        mites = st.checkbox("🕷️ Mites")
+    with colP3:
+        caterpillars = st.checkbox("🐛 Caterpillars")
+    with colP4:
+        whiteflies = st.checkbox("🦟 Whiteflies")
+
+    # -------------------------------------------------------------------
+    # 2) Run the Expert System
+    # -------------------------------------------------------------------
+    st.write("---")
+    center = st.container()
+    with center:
+        st.markdown("<h3 style='text-align:center;'>🔍 Analyze Inputs & Generate Recommendations</h3>", unsafe_allow_html=True)
+        hypothesis = st.selectbox("Check specific hypothesis",
+                                  ("Full analysis (all rules)",) + crop_hypotheses(crop_name))
+        fast_mode = st.toggle("⚡ Fast mode (compiled rules, no Experta engine)")
+        run_btn = st.form_submit_button("🚀 Run AgriSense Expert System", use_container_width=True)
 
 if run_btn:
-    engine = AgriSenseEngine()
-    engine.reset()
-
-    # Declare collected facts
-    engine.declare(Crop(name=crop_name, stage=crop_stage))
-    engine.declare(Soil(type=soil_type, moisture=soil_moisture, ph=soil_ph))
-    engine.declare(Lab(N=N, P=P, K=K, ph=soil_ph))
-    engine.declare(Symptoms(
-        leaf_spots=leaf_spots,
-        yellowing=yellowing,
-        wilting=wilting,
-        stem_lesions=stem_lesions,
-        mosaic=mosaic,
-        powdery_white=powdery_white,
-        black_sooty=black_sooty
-    ))
-    engine.declare(Weather(temp=temp, humidity=humidity, recent_rain_days=recent_rain))
-    engine.declare(PestPresence(
-        aphids=aphids, mites=mites,
-        caterpillars=caterpillars, whiteflies=whiteflies
-    ))
-
-    engine.run()
-    diagnoses, recs = engine.get_results()
+    # Collected inputs
+    inputs = (crop_name, crop_stage, soil_type, soil_ph, soil_moisture, N, P, K,
+              temp, humidity, recent_rain,
+              leaf_spots, yellowing, wilting, stem_lesions, mosaic, powdery_white, black_sooty,
+              aphids, mites, caterpillars, whiteflies)
+
+    if hypothesis in HEAD_INDEX:
+        # Backward chaining: only the rules that can conclude the hypothesis
+        diagnoses, recs = check_hypothesis(hypothesis, inputs)
+    elif fast_mode:
+        diag_mask, rec_mask = infer(
+            *crop_profile(crop_name), STAGES.index(crop_stage), soil_ph, N, P, K, humidity,
+            leaf_spots, yellowing, wilting, stem_lesions, mosaic, powdery_white,
+            aphids, caterpillars, whiteflies
+        )
+        diagnoses, recs = decode(diag_mask, rec_mask, soil_ph)
+    else:
+        diagnoses, recs = diagnose(inputs)
 
     # -------------------------------------------------------------------
     # 3) Display Results using Cards
     # -------------------------------------------------------------------
     st.write("---")
     st.markdown("<h2 style='text-align:center;'>📊 Results</h2>", unsafe_allow_html=True)
+    if hypothesis in HEAD_INDEX:
+        if diagnoses:
+            st.error(f"Hypothesis supported by the inputs: **{hypothesis}**")
+        else:
+            st.success(f"Hypothesis not supported by the inputs: **{hypothesis}**")
 
     colA, colB = st.columns(2)
 
@@ -139,9 +252,7 @@ if run_btn:
         st.subheader("🩺 Diagnoses")
         if diagnoses:
             for d in diagnoses:
-                st.success(f"**Disease:** {d.get('disease')}")
-                st.write(f"**Confidence:** {d.get('confidence')}")
-                st.info(d.get("notes"))
+                render(d, Diagnosis._PUBLIC_FIELDS, DIAGNOSIS_RENDER)
         else:
             st.info("No disease detected or insufficient data.")
 
@@ -150,17 +261,28 @@ if run_btn:
         st.subheader("💡 Recommendations")
         if recs:
             for r in recs:
-                if "treatment" in r:
-                    st.warning(f"**Treatment:** {r['treatment']}")
-                if "stage_advice" in r:
-                    st.info(f"**Stage Advice:** {r['stage_advice']}")
-                if "fertilizer_recommendations" in r:
-                    st.success("**Fertilizer Recommendations:**")
-                    for f in r["fertilizer_recommendations"]:
-                        st.write(f"🌱 {f}")
+                render(r, Recommendation._PUBLIC_FIELDS, RECOMMENDATION_RENDER)
         else:
             st.info("No recommendations available.")
 
+# -------------------------------------------------------------------
+# 4) Batch analysis of many samples (CSV upload)
+# -------------------------------------------------------------------
+st.write("---")
+st.subheader("📂 Batch Analysis")
+samples_csv = st.file_uploader(
+    f"Upload samples as CSV (columns: {', '.join(BATCH_COLUMNS)})", type="csv")
+if samples_csv is not None:
+    samples = pd.read_csv(samples_csv)
+    missing = [c for c in BATCH_COLUMNS if c not in samples.columns]
+    if missing:
+        st.error(f"Missing columns: {', '.join(missing)}")
+    else:
+        try:
+            st.dataframe(samples.join(analyze_batch(samples)), use_container_width=True)
+        except ValueError as e:
+            st.error(str(e))
+
 # Footer
 st.write("---")
 st.markdown("<p style='text-align:center;'>🌾 Built with ❤️ using Streamlit & Experta</p>", unsafe_allow_html=True)
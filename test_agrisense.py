@@ -0,0 +1,105 @@
+"""
+Regression checks for AgriSenseEngine.update() and the fast paths  (pip install pytest)
+
+update() re-derives only what a changed input affects, with its own support
+tracking and cascading retraction; a random walk over the inputs checks it
+always ends up with the same results as a freshly reset engine.
+
+agrisense_fast restates the rules by hand (infer()/decode() and the NumPy
+batch rules), so random inputs around the thresholds check both still
+conclude exactly what the engine does.
+"""
+
+import random
+
+import pandas as pd
+
+from agrisense import (AgriSenseEngine, Crop, Soil, Lab, Symptoms, Weather, PestPresence,
+                       CROPS, STAGES, SOIL_TYPES, MOISTURE_LEVELS, crop_engine, fact_key)
+from agrisense_fast import (SYMPTOM_COLUMNS, PEST_COLUMNS, analyze_batch, crop_profile,
+                            decode, infer)
+
+# Values each input slot can take, chosen around the rule thresholds
+SLOT_VALUES = {
+    Crop: {'name': CROPS, 'stage': STAGES},
+    Soil: {'type': SOIL_TYPES, 'moisture': MOISTURE_LEVELS, 'ph': (5.0, 6.5, 8.2)},
+    Lab: {'N': (20, 80, 200), 'P': (20, 80, 200), 'K': (20, 80, 200), 'ph': (5.0, 6.5)},
+    Symptoms: {k: (False, True) for k in Symptoms._PUBLIC_FIELDS},
+    Weather: {'temp': (15, 30), 'humidity': (60, 90), 'recent_rain_days': (0, 5)},
+    PestPresence: {k: (False, True) for k in PestPresence._PUBLIC_FIELDS},
+}
+
+def results(engine):
+    diagnoses, recs = engine.get_results()
+    return sorted(map(repr, map(fact_key, diagnoses))), sorted(map(repr, map(fact_key, recs)))
+
+def fresh(slots):
+    """New (undeclared) input facts for the current slot values."""
+    return [cls(**values) for cls, values in slots.items()]
+
+def test_update_matches_fresh_engine():
+    rng = random.Random(0)
+    slots = {cls: {k: rng.choice(v) for k, v in values.items()}
+             for cls, values in SLOT_VALUES.items()}
+    engine = AgriSenseEngine()
+    for step in range(1000):
+        cls = rng.choice(list(SLOT_VALUES))
+        if rng.random() < 0.1:
+            # Drop an input class, or bring a dropped one back
+            if cls in slots:
+                del slots[cls]
+            else:
+                slots[cls] = {k: rng.choice(v) for k, v in SLOT_VALUES[cls].items()}
+        elif cls in slots:
+            slot = rng.choice(list(SLOT_VALUES[cls]))
+            slots[cls][slot] = rng.choice(SLOT_VALUES[cls][slot])
+
+        engine.update(*fresh(slots))
+        engine.run()
+
+        reference = AgriSenseEngine()
+        reference.reset()
+        reference.declare(*fresh(slots))
+        reference.run()
+        assert results(engine) == results(reference), step
+
+
+def slots(results):
+    """Public slots of result facts or dicts, comparable across both paths."""
+    return sorted(repr(sorted((k, tuple(v) if isinstance(v, (list, tuple)) else v)
+                              for k, v in r.items() if not k.startswith('__')))
+                  for r in results)
+
+def test_infer_matches_engine():
+    rng = random.Random(1)
+    engines = {crop: crop_engine(crop)() for crop in CROPS}
+    for case in range(2000):
+        crop, stage = rng.choice(CROPS), rng.choice(STAGES)
+        ph = rng.choice((4.0, 4.99, 5.0, 5.2, 5.49, 5.5, 6.5, 7.0, 7.01, 7.8, 7.81, 9.0))
+        N, P, K = (rng.choice((0, 49, 50, 149, 150, 500)) for _ in range(3))
+        humidity = rng.choice((0, 75, 76, 100))
+        symptoms = {k: rng.random() < 0.3 for k in SYMPTOM_COLUMNS}
+        pests = {k: rng.random() < 0.3 for k in PEST_COLUMNS}
+
+        diag, rec = infer(*crop_profile(crop), STAGES.index(stage), ph, N, P, K, humidity,
+                          *symptoms.values(), *pests.values())
+        fast = decode(diag, rec, ph)
+
+        engine = engines[crop]
+        engine.reset()
+        engine.declare(Crop(name=crop, stage=stage),
+                       Soil(type='loam', moisture='adequate', ph=ph),
+                       Lab(N=N, P=P, K=K, ph=ph),
+                       Symptoms(black_sooty=False, **symptoms),
+                       Weather(temp=20, humidity=humidity, recent_rain_days=0),
+                       PestPresence(mites=False, **pests))
+        engine.run()
+        assert list(map(slots, fast)) == list(map(slots, engine.get_results())), case
+
+def test_batch_engines_agree():
+    rng = random.Random(2)
+    df = pd.DataFrame([{**{k: rng.random() < 0.4 for k in SYMPTOM_COLUMNS + PEST_COLUMNS},
+                        'humidity': rng.choice((50, 75, 76, 90)),
+                        'N': rng.choice((10, 49, 50, 200))}
+                       for _ in range(300)])
+    assert analyze_batch(df).equals(analyze_batch(df, engine='experta'))